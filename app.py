@@ -1,8 +1,31 @@
 import os
+import gzip
+import queue
+import atexit
+import logging
+import logging.handlers
 import json
-from flask import Flask, redirect, url_for, session, request, render_template, flash
+import time
+import functools
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass
+from collections import deque
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor
+import orjson
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache
+from flask import Flask, Response, redirect, url_for, session, request, render_template, flash, get_flashed_messages
+from flask.json.provider import JSONProvider
+from flask_session import Session
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from spotipy.cache_handler import FlaskSessionCacheHandler, MemoryCacheHandler, RedisCacheHandler
 from dotenv import load_dotenv
 from database import (
     register_user,
@@ -11,47 +34,590 @@ from database import (
     get_or_create_user,
     update_user_with_spotify,
     get_user_by_auth_id,
+    invalidate_user,
     save_selected_playlist,
-    get_last_selected_playlist,
-    save_to_queue_history
+    queue_history_row,
+    save_queue_history_rows,
+    ping as ping_database,
+    SUPABASE_HTTP_LIMITS
 )
 
 load_dotenv()
 
+# Os logs são formatados na requisição e gravados por uma thread em
+# segundo plano, sem escrita síncrona no stdout durante a requisição
+_LOG_QUEUE = queue.SimpleQueue()
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO'),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+    handlers=[logging.handlers.QueueHandler(_LOG_QUEUE)]
+)
+_LOG_LISTENER = logging.handlers.QueueListener(_LOG_QUEUE, logging.StreamHandler())
+_LOG_LISTENER.start()
+atexit.register(_LOG_LISTENER.stop)
+# O httpx (cliente do Supabase) registra cada requisição em INFO, com a URL
+# e os filtros (ids de usuários); só avisos e erros dele chegam aos logs
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+logging.getLogger(__name__).info(
+    'Pool HTTP do Supabase: max_connections=%s, max_keepalive_connections=%s',
+    SUPABASE_HTTP_LIMITS.max_connections, SUPABASE_HTTP_LIMITS.max_keepalive_connections
+)
+
+class OrjsonProvider(JSONProvider):
+    """Provider JSON do Flask baseado em orjson, bem mais rápido que o json padrão."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Evita o decode/encode de str: orjson já gera bytes UTF-8
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY')
 
 CLIENT_ID = os.environ.get('SPOTIPY_CLIENT_ID')
 CLIENT_SECRET = os.environ.get('SPOTIPY_CLIENT_SECRET')
 REDIRECT_URI = os.environ.get('SPOTIPY_REDIRECT_URI')
 
+SPOTIFY_API_URL = 'https://api.spotify.com/v1/'
+
+# Só os campos usados por _format_tracks; o restante (available_markets,
+# external_ids...) é a maior parte do payload de cada página.
+PLAYLIST_ITEMS_FIELDS = 'items(track(id,name,uri,artists(name),album(images(url)))),next,total'
+
 SCOPES = 'user-read-playback-state user-modify-playback-state playlist-read-private user-library-read'
 
-def get_spotify_oauth():
-    """Retorna um objeto SpotifyOAuth configurado."""
-    return SpotifyOAuth(
-        client_id=CLIENT_ID,
-        client_secret=CLIENT_SECRET,
-        redirect_uri=REDIRECT_URI,
-        scope=SCOPES
+# Redis compartilhado entre processos (opcional): sessões e caches.
+# Sem REDIS_URL, as sessões ficam no cookie assinado e só o cache em
+# memória de cada processo é usado.
+REDIS_URL = os.environ.get('REDIS_URL')
+REDIS_MAX_CONNECTIONS = 50
+_REDIS = (
+    redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS))
+    if REDIS_URL else None
+)
+
+# O redirect do Spotify aponta para o endereço público do app: se for HTTPS,
+# o cookie de sessão só trafega por HTTPS
+app.config['SESSION_COOKIE_SECURE'] = (REDIRECT_URI or '').startswith('https://')
+
+if _REDIS:
+    # Sessão no servidor: o cookie leva apenas o id da sessão,
+    # e os dados do usuário ficam no Redis, visíveis para todos os workers
+    app.config.update(
+        SESSION_TYPE='redis',
+        SESSION_REDIS=_REDIS,
+        SESSION_PERMANENT=True,
+        PERMANENT_SESSION_LIFETIME=timedelta(days=30)
+    )
+    Session(app)
+
+# Cache em memória das respostas da API do Spotify, já serializadas em JSON
+# (e em gzip). Evita refazer a paginação e a serialização a cada carregamento.
+_PLAYLIST_TRACKS_CACHE = TTLCache(maxsize=1024, ttl=300)  # (auth_id, playlist_id) -> (json, gzip)
+_USER_PLAYLISTS_CACHE = TTLCache(maxsize=1024, ttl=300)  # auth_id -> (json, gzip)
+
+PLAYLIST_TRACKS_REDIS_TTL = 24 * 60 * 60  # a chave inclui o snapshot_id da playlist
+USER_PLAYLISTS_REDIS_TTL = 5 * 60
+
+def _redis_get(key):
+    """Lê uma chave do Redis; falhas do Redis são tratadas como cache miss."""
+    try:
+        return _REDIS.get(key)
+    except redis.RedisError as e:
+        app.logger.warning('Erro ao ler do Redis: %s', e)
+        return None
+
+def _redis_setex(key, ttl, value):
+    """Grava uma chave no Redis com expiração, sem interromper a requisição em caso de falha."""
+    try:
+        _REDIS.setex(key, ttl, value)
+    except redis.RedisError as e:
+        app.logger.warning('Erro ao gravar no Redis: %s', e)
+
+# ETag e página formatada de /me/playlists, para requisições condicionais
+_USER_PLAYLISTS_ETAGS = TTLCache(maxsize=4096, ttl=3600)  # (auth_id, offset) -> (etag, página)
+_CACHE_LOCK = threading.Lock()
+
+def _cache_get(cache, key):
+    """Lê uma entrada do cache (TTLCache não é thread-safe)."""
+    with _CACHE_LOCK:
+        return cache.get(key)
+
+def _cache_set(cache, key, value):
+    """Grava uma entrada no cache."""
+    with _CACHE_LOCK:
+        cache[key] = value
+
+def _cache_pop(cache, key):
+    """Remove uma entrada do cache, se existir."""
+    with _CACHE_LOCK:
+        cache.pop(key, None)
+
+# Sessão HTTP compartilhada por todos os clientes Spotipy, mantendo as
+# conexões TLS com api.spotify.com abertas entre requisições.
+# Como o Spotipy não configura retries em sessões externas, o Retry
+# abaixo reproduz a política padrão dele para erros 5xx. O 429 fica fora
+# do Retry (nem pelo status_forcelist, nem pelo Retry-After, que o urllib3
+# respeitaria sem limite): vira uma SpotifyException com os headers e é
+# tratado apenas por _retry_on_rate_limit, com espera limitada.
+# Esgotadas as tentativas, a última resposta é devolvida (raise_on_status=False).
+_HTTP_SESSION = requests.Session()
+_HTTP_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=20,  # hosts distintos (api e accounts.spotify.com)
+    pool_maxsize=100,  # conexões por host, >= SPOTIFY_PAGE_WORKERS
+    max_retries=Retry(
+        total=3,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=3,
+        backoff_factor=0.3,
+        status_forcelist=tuple(c for c in spotipy.Spotify.default_retry_codes if c != 429),
+        respect_retry_after_header=False,
+        raise_on_status=False
     )
+))
+
+class _SharedSessionSpotify(spotipy.Spotify):
+    """Cliente Spotipy que usa a sessão HTTP compartilhada."""
+
+    def __del__(self):
+        # O Spotify.__del__ original fecha a sessão, o que derrubaria
+        # o pool de conexões compartilhado a cada requisição.
+        pass
+
+# Pool de threads compartilhado para buscar páginas do Spotify em paralelo.
+# Fica aberto durante toda a vida do processo, sem criar threads a cada
+# requisição; o tamanho acompanha o pool de conexões da _HTTP_SESSION.
+SPOTIFY_PAGE_WORKERS = 32
+_PAGE_POOL = ThreadPoolExecutor(max_workers=SPOTIFY_PAGE_WORKERS, thread_name_prefix='spotify-page')
+# Páginas em andamento por requisição, para não estourar o rate limit do Spotify
+SPOTIFY_PAGE_CONCURRENCY = 5
+SPOTIFY_RATE_LIMIT_RETRIES = 3
+# Espera máxima por tentativa, para não estourar o timeout do worker do Gunicorn
+SPOTIFY_RATE_LIMIT_MAX_WAIT = 10
+
+def _retry_after_seconds(headers, default):
+    """
+    Segundos indicados no header Retry-After (em segundos ou como data HTTP),
+    limitados a SPOTIFY_RATE_LIMIT_MAX_WAIT. Sem header válido, usa default.
+    """
+    value = (headers or {}).get('Retry-After')
+    seconds = default
+    if value:
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                pass
+    return min(max(seconds, 0), SPOTIFY_RATE_LIMIT_MAX_WAIT)
+
+def _retry_on_rate_limit(func):
+    """
+    Decorator que repete a chamada quando o Spotify responde 429,
+    aguardando o tempo indicado no header Retry-After (ou, sem ele,
+    um backoff exponencial: 1, 2, 4... segundos), até SPOTIFY_RATE_LIMIT_MAX_WAIT.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(SPOTIFY_RATE_LIMIT_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except spotipy.SpotifyException as e:
+                if e.http_status != 429 or attempt == SPOTIFY_RATE_LIMIT_RETRIES - 1:
+                    raise
+                time.sleep(_retry_after_seconds(e.headers, 2 ** attempt))
+    return wrapper
+
+def _fetch_all_pages(fetch_page, limit, format_items=None):
+    """
+    Busca e formata todos os itens de um endpoint paginado do Spotify.
+    A primeira página informa o total; as demais são buscadas em paralelo.
+    Cada página é formatada assim que chega, sem acumular as respostas brutas.
+    Sem format_items, as páginas já devem vir formatadas.
+    """
+    fetch_page = _retry_on_rate_limit(fetch_page)
+
+    def fetch_formatted(offset):
+        page = fetch_page(offset)
+        items = format_items(page['items']) if format_items else page['items']
+        return page['total'], items
+
+    total, first_items = fetch_formatted(0)
+    formatted = list(first_items)
+
+    # Janela deslizante: no máximo SPOTIFY_PAGE_CONCURRENCY páginas em
+    # andamento, consumidas na ordem dos offsets
+    offsets = iter(range(limit, total, limit))
+    pending = deque(
+        _PAGE_POOL.submit(fetch_formatted, offset)
+        for offset in islice(offsets, SPOTIFY_PAGE_CONCURRENCY)
+    )
+    while pending:
+        _, items = pending.popleft().result()
+        formatted.extend(items)
+        offset = next(offsets, None)
+        if offset is not None:
+            pending.append(_PAGE_POOL.submit(fetch_formatted, offset))
+    return formatted
+
+def _spotify_get(access_token, path, params=None, etag=None):
+    """
+    Faz um GET direto na API do Spotify pela sessão compartilhada.
+    Com etag, envia If-None-Match e a resposta pode ser 304.
+    Erros são levantados como spotipy.SpotifyException, como no Spotipy.
+    """
+    headers = {'Authorization': f'Bearer {access_token}'}
+    if etag:
+        headers['If-None-Match'] = etag
+
+    response = _HTTP_SESSION.get(SPOTIFY_API_URL + path, params=params, headers=headers, timeout=5)
+    if response.status_code >= 400:
+        try:
+            error = response.json()['error']
+            msg, reason = error.get('message'), error.get('reason')
+        except (ValueError, KeyError, TypeError):
+            msg, reason = response.text, None
+        raise spotipy.SpotifyException(
+            response.status_code, -1, f'{response.url}:\n {msg}',
+            reason=reason, headers=response.headers
+        )
+    return response
+
+def _spotify_get_json(access_token, path, params=None):
+    """GET na API do Spotify com o corpo decodificado pelo orjson."""
+    return orjson.loads(_spotify_get(access_token, path, params=params).content)
+
+def _fetch_user_playlists_page(access_token, auth_id, offset):
+    """
+    Busca uma página de /me/playlists já formatada. Reenvia o ETag da
+    última resposta e, se o Spotify responder 304, reaproveita a página salva.
+    """
+    key = (auth_id, offset)
+    cached = _cache_get(_USER_PLAYLISTS_ETAGS, key)
+    response = _spotify_get(
+        access_token, 'me/playlists',
+        params={'limit': 50, 'offset': offset},
+        etag=cached[0] if cached else None
+    )
+
+    if response.status_code == 304 and cached:
+        return cached[1]
+
+    data = orjson.loads(response.content)
+    page = {'total': data['total'], 'items': _format_playlists(data['items'])}
+    etag = response.headers.get('ETag')
+    if etag:
+        _cache_set(_USER_PLAYLISTS_ETAGS, key, (etag, page))
+    return page
+
+def _first_image_url(images):
+    """URL da primeira imagem de uma lista de imagens do Spotify, ou None."""
+    return images[0]['url'] if images else None
+
+def _spotify_display_name(profile):
+    """Nome exibido de um perfil do Spotify, com o email como alternativa."""
+    return profile.get('display_name') or profile['email']
+
+def _format_playlists(playlists):
+    """Converte playlists da API do Spotify no formato usado pelo frontend."""
+    return [
+        {
+            'id': playlist['id'],
+            'name': playlist['name'],
+            'image': images[0]['url'] if (images := playlist['images']) else None,
+            'tracks_total': playlist['tracks']['total'],
+            'owner': playlist['owner']['display_name']
+        }
+        for playlist in playlists if playlist
+    ]
+
+@dataclass(slots=True)
+class Track:
+    """
+    Faixa no formato enviado ao frontend. Com __slots__ ocupa bem menos
+    memória que um dict por faixa, e o orjson serializa dataclasses nativamente.
+    """
+    id: str
+    name: str
+    artist: str
+    uri: str
+    album_art: str | None
+
+def _format_tracks(items):
+    """
+    Converte itens de playlist do Spotify no formato usado pelo frontend.
+    Itens sem faixa (removidas ou indisponíveis) são ignorados.
+    """
+    join = ', '.join
+    return [
+        Track(
+            track['id'],
+            track['name'],
+            join(artist['name'] for artist in track['artists']),
+            track['uri'],
+            images[0]['url'] if (images := track['album']['images']) else None
+        )
+        for item in items if (track := item.get('track'))
+    ]
+
+# Instância única: client_id, secret, redirect e scopes são fixos no processo.
+# O cache em memória nunca é lido (check_cache=False no callback), então um
+# token de um usuário não vaza para outro. O token de cada usuário fica em
+# _token_cache_handler(). As trocas e renovações de token usam a mesma
+# sessão HTTP da API, reaproveitando as conexões abertas.
+_SP_OAUTH = SpotifyOAuth(
+    client_id=CLIENT_ID,
+    client_secret=CLIENT_SECRET,
+    redirect_uri=REDIRECT_URI,
+    scope=SCOPES,
+    cache_handler=MemoryCacheHandler(),
+    requests_session=_HTTP_SESSION,
+    requests_timeout=5
+)
+
+def _encode_body(body):
+    """Par (json, gzip) a partir de um corpo JSON já serializado."""
+    return body, gzip.compress(body, compresslevel=6)
+
+def _encode_json(payload):
+    """Serializa o payload uma única vez, junto com a versão comprimida em gzip."""
+    return _encode_body(orjson.dumps(payload))
+
+def _encoded_response(encoded, mimetype, status=200):
+    """Resposta a partir de um par (corpo, gzip), escolhendo pelo Accept-Encoding."""
+    body, gzipped = encoded
+    if request.accept_encodings['gzip'] > 0:
+        response = Response(gzipped, status=status, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _json_response(encoded, status=200):
+    """Resposta JSON a partir dos bytes gerados por _encode_json."""
+    return _encoded_response(encoded, 'application/json', status)
+
+# Páginas que não dependem do usuário, renderizadas uma vez por processo
+_PRERENDERED_PAGES = {}  # template -> (html, gzip)
+
+def _render_static_page(template):
+    """
+    Renderiza um template sem estado por usuário. Sem mensagens flash
+    pendentes, reaproveita o HTML (e o gzip) gerado na primeira renderização.
+    """
+    if app.debug or get_flashed_messages():
+        return render_template(template)
+
+    page = _PRERENDERED_PAGES.get(template)
+    if page is None:
+        page = _PRERENDERED_PAGES[template] = _encode_body(render_template(template).encode())
+    return _encoded_response(page, 'text/html')
+
+# A URL de autorização não usa state, então é a mesma para todos os usuários
+_AUTHORIZE_URL = _SP_OAUTH.get_authorize_url()
+
+def get_spotify_oauth():
+    """Retorna o objeto SpotifyOAuth configurado."""
+    return _SP_OAUTH
+
+# Gravações no Supabase que não precisam bloquear a resposta ao cliente
+DB_WRITE_WORKERS = 8
+_DB_POOL = ThreadPoolExecutor(max_workers=DB_WRITE_WORKERS, thread_name_prefix='db-write')
+
+def _run_db_write(func, kwargs):
+    """
+    Executa a gravação e registra a falha. As funções de database.py
+    capturam os próprios erros e retornam None, sem levantar exceção.
+    """
+    try:
+        if func(**kwargs) is None:
+            app.logger.warning('Gravação em segundo plano sem resultado: %s', func.__name__)
+    except Exception:
+        app.logger.exception('Erro ao gravar no banco em segundo plano (%s)', func.__name__)
+
+def _submit_db_write(func, **kwargs):
+    """Agenda uma gravação no banco sem esperar pelo resultado."""
+    _DB_POOL.submit(_run_db_write, func, kwargs)
+
+# Histórico de fila: as músicas entram numa fila em memória e uma thread
+# junta os lotes, enviados ao _DB_POOL com um único INSERT por lote
+QUEUE_HISTORY_FLUSH_INTERVAL = 0.1  # segundos
+QUEUE_HISTORY_MAX_BATCH = 100
+# Com o Supabase lento, a fila para de crescer aqui e as músicas excedentes são descartadas
+QUEUE_HISTORY_MAX_PENDING = 10_000
+_QUEUE_HISTORY_WRITES = queue.Queue(maxsize=QUEUE_HISTORY_MAX_PENDING)  # linhas de queue_history
+_QUEUE_HISTORY_STOP = object()
+# Lotes gravando ao mesmo tempo: com todos ocupados, a thread espera e o
+# acúmulo fica em _QUEUE_HISTORY_WRITES, que é limitada
+_QUEUE_HISTORY_IN_FLIGHT = threading.BoundedSemaphore(DB_WRITE_WORKERS)
+
+def _enqueue_queue_history(user_id, track, playlist_id=None):
+    """Agenda a gravação de uma música no histórico de fila."""
+    try:
+        _QUEUE_HISTORY_WRITES.put_nowait(queue_history_row(user_id, track, playlist_id))
+    except queue.Full:
+        app.logger.warning('Fila do histórico cheia, música descartada: %s', track['id'])
+
+def _write_queue_history_batch(rows):
+    """
+    Grava um lote do histórico, de qualquer número de usuários, com um
+    único INSERT no _DB_POOL. No encerramento, quando o pool não aceita
+    mais tarefas, grava nesta thread.
+    """
+    _QUEUE_HISTORY_IN_FLIGHT.acquire()
+    try:
+        future = _DB_POOL.submit(_run_db_write, save_queue_history_rows, {'rows': rows})
+    except RuntimeError:
+        _QUEUE_HISTORY_IN_FLIGHT.release()
+        _run_db_write(save_queue_history_rows, {'rows': rows})
+        return
+    future.add_done_callback(lambda _: _QUEUE_HISTORY_IN_FLIGHT.release())
+
+def _drain_queue_history():
+    """
+    Espera a primeira música, junta as que chegarem em até
+    QUEUE_HISTORY_FLUSH_INTERVAL (no máximo QUEUE_HISTORY_MAX_BATCH) e grava o lote.
+    """
+    while True:
+        batch = []
+        stop = False
+        item = _QUEUE_HISTORY_WRITES.get()
+        deadline = time.monotonic() + QUEUE_HISTORY_FLUSH_INTERVAL
+        while True:
+            if item is _QUEUE_HISTORY_STOP:
+                stop = True
+                break
+            batch.append(item)
+            timeout = deadline - time.monotonic()
+            if len(batch) >= QUEUE_HISTORY_MAX_BATCH or timeout <= 0:
+                break
+            try:
+                item = _QUEUE_HISTORY_WRITES.get(timeout=timeout)
+            except queue.Empty:
+                break
+        if batch:
+            _write_queue_history_batch(batch)
+        if stop:
+            return
+
+_QUEUE_HISTORY_THREAD = threading.Thread(target=_drain_queue_history, name='queue-history', daemon=True)
+_QUEUE_HISTORY_THREAD.start()
+
+def _flush_queue_history():
+    """Grava o que ainda estiver na fila antes de o processo terminar."""
+    try:
+        _QUEUE_HISTORY_WRITES.put(_QUEUE_HISTORY_STOP, timeout=1)
+    except queue.Full:
+        return
+    _QUEUE_HISTORY_THREAD.join(timeout=5)
+
+atexit.register(_flush_queue_history)
+
+# Renova o token um pouco antes de expirar, evitando chamadas com token vencido
+TOKEN_REFRESH_MARGIN = 60
+
+_TOKEN_REFRESH_LOCKS = TTLCache(maxsize=1024, ttl=300)  # refresh_token -> Lock
+_REFRESHED_TOKENS = TTLCache(maxsize=1024, ttl=60)  # refresh_token -> token_info renovado
+
+def _refresh_token(token_info):
+    """
+    Renova o token de acesso. Requisições simultâneas com o mesmo
+    refresh_token esperam a primeira renovação e reaproveitam o resultado.
+    """
+    refresh_token = token_info['refresh_token']
+    with _CACHE_LOCK:
+        lock = _TOKEN_REFRESH_LOCKS.setdefault(refresh_token, threading.Lock())
+
+    with lock:
+        refreshed = _cache_get(_REFRESHED_TOKENS, refresh_token)
+        if refreshed is None:
+            refreshed = _SP_OAUTH.refresh_access_token(refresh_token)
+            _cache_set(_REFRESHED_TOKENS, refresh_token, refreshed)
+    return refreshed
+
+class _ExpiringRedisCacheHandler(RedisCacheHandler):
+    """
+    RedisCacheHandler que grava o token com expiração igual à da sessão,
+    para não deixar no Redis tokens de sessões que já expiraram.
+    """
+
+    def save_token_to_cache(self, token_info):
+        try:
+            self.redis.set(self.key, orjson.dumps(token_info), ex=app.permanent_session_lifetime)
+        except redis.RedisError as e:
+            app.logger.warning('Erro ao salvar token no Redis: %s', e)
+
+def _token_cache_handler():
+    """
+    Retorna onde o token do Spotify do usuário logado fica guardado: no Redis,
+    compartilhado entre os workers, ou na sessão quando não há Redis.
+    """
+    if _REDIS:
+        return _ExpiringRedisCacheHandler(_REDIS, key=f"spotify_token:{session['auth_id']}")
+    return FlaskSessionCacheHandler(session)
+
+def _clear_spotify_token():
+    """Descarta o token do Spotify do usuário logado."""
+    if _REDIS and session.get('auth_id'):
+        try:
+            _REDIS.delete(f"spotify_token:{session['auth_id']}")
+        except redis.RedisError as e:
+            app.logger.warning('Erro ao remover token do Redis: %s', e)
+    session.pop('token_info', None)
+
+def get_access_token():
+    """
+    Obtém o token de acesso do Spotify salvo no cache de tokens,
+    atualizando-o se necessário.
+    """
+    if not session.get('auth_id'):
+        return None
+
+    cache_handler = _token_cache_handler()
+    token_info = cache_handler.get_cached_token()
+
+    if not token_info:
+        return None
+
+    if time.time() > token_info['expires_at'] - TOKEN_REFRESH_MARGIN:
+        token_info = _refresh_token(token_info)
+        cache_handler.save_token_to_cache(token_info)
+
+    return token_info['access_token']
 
 def get_spotipy_client():
     """
     Obtém um objeto Spotipy para interagir com a API,
     atualizando o token se necessário.
     """
-    sp_oauth = get_spotify_oauth()
-    token_info = session.get('token_info', None)
+    access_token = get_access_token()
 
-    if not token_info:
+    if not access_token:
         return None
 
-    if sp_oauth.is_token_expired(token_info):
-        token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
-        session['token_info'] = token_info
+    return _SharedSessionSpotify(auth=access_token, requests_session=_HTTP_SESSION)
 
-    return spotipy.Spotify(auth=token_info['access_token'])
+def _spotify_error_response(e, message):
+    """Converte uma SpotifyException na resposta de erro dos endpoints da API."""
+    if e.http_status == 401:
+        _clear_spotify_token()
+        return {'error': 'Token de acesso expirado. Por favor, autorize novamente.'}, 401
+    if e.http_status == 404 and e.reason and 'NO_ACTIVE_DEVICE' in e.reason.upper():
+        return {'error': 'Nenhum dispositivo ativo encontrado. Por favor, inicie a reprodução no Spotify.'}, 409
+    app.logger.error('%s: %s', message, e)
+    return {'error': f'{message}: {e}'}, 500
 
 @app.route('/')
 def index():
@@ -59,7 +625,7 @@ def index():
     if session.get('auth_id'):
         # Usuário já está autenticado, redireciona para seleção de playlist
         return redirect(url_for('select_playlist'))
-    return render_template('index.html')
+    return _render_static_page('index.html')
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -97,8 +663,8 @@ def register():
             if db_user:
                 session['auth_id'] = auth_id
                 session['email'] = email
-                session['user_id'] = str(db_user['id'])  # IMPORTANTE: Adiciona user_id aqui
-                session['user_name'] = db_user['display_name']
+                session['user_id'] = str(db_user.id)  # IMPORTANTE: Adiciona user_id aqui
+                session['user_name'] = db_user.display_name
                 flash('Registro realizado com sucesso! Agora autorize o Spotify.', 'success')
                 return redirect(url_for('login_spotify'))
             else:
@@ -108,7 +674,7 @@ def register():
             flash('Erro ao registrar. Este email pode já estar cadastrado.', 'danger')
             return redirect(url_for('register'))
 
-    return render_template('register.html')
+    return _render_static_page('register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -131,12 +697,12 @@ def login():
             # Buscar usuário no banco de dados
             user = get_user_by_auth_id(auth_id)
             if user:
-                session['user_id'] = str(user['id'])  # IMPORTANTE: Adiciona user_id aqui
-                session['user_name'] = user['display_name']
+                session['user_id'] = str(user.id)  # IMPORTANTE: Adiciona user_id aqui
+                session['user_name'] = user.display_name
                 flash('Login realizado com sucesso!', 'success')
                 
                 # Se o usuário já autorizou Spotify antes, vai para jukebox
-                if user.get('spotify_id'):
+                if user.spotify_id:
                     return redirect(url_for('select_playlist'))
                 else:
                     # Senão, pede para autorizar Spotify
@@ -148,14 +714,12 @@ def login():
             flash('Email ou senha incorretos.', 'danger')
             return redirect(url_for('login'))
 
-    return render_template('login.html')
+    return _render_static_page('login.html')
 
 @app.route('/login_spotify')
 def login_spotify():
     """Redireciona para o login do Spotify."""
-    sp_oauth = get_spotify_oauth()
-    auth_url = sp_oauth.get_authorize_url()
-    return redirect(auth_url)
+    return redirect(_AUTHORIZE_URL)
 
 @app.route('/callback')
 def callback():
@@ -175,27 +739,29 @@ def callback():
         return redirect(url_for('login'))
 
     try:
-        token_info = sp_oauth.get_access_token(code)
-        session['token_info'] = token_info
+        token_info = sp_oauth.get_access_token(code, check_cache=False)
+        _token_cache_handler().save_token_to_cache(token_info)
         
         # Obter informações do usuário Spotify
-        sp = spotipy.Spotify(auth=token_info['access_token'])
+        sp = _SharedSessionSpotify(auth=token_info['access_token'], requests_session=_HTTP_SESSION)
         current_user = sp.current_user()
         
         # Atualizar usuário no Supabase com dados do Spotify
         auth_id = session.get('auth_id')
+        display_name = _spotify_display_name(current_user)
+        profile_image_url = _first_image_url(current_user.get('images'))
         result = update_user_with_spotify(
             auth_id=auth_id,
             spotify_id=current_user['id'],
-            display_name=current_user['display_name'] or current_user['email'],
+            display_name=display_name,
             email=current_user['email'],
-            profile_image_url=current_user['images'][0]['url'] if current_user['images'] else None
+            profile_image_url=profile_image_url
         )
         
         if result['success']:
             updated_user = result['user']
-            session['user_id'] = str(updated_user['id'])
-            session['user_name'] = updated_user['display_name']
+            session['user_id'] = str(updated_user.id)
+            session['user_name'] = updated_user.display_name
             flash('Perfil atualizado com dados do Spotify!', 'success')
             return redirect(url_for('select_playlist'))
         else:
@@ -208,7 +774,7 @@ def callback():
             return redirect(url_for('login_spotify'))
             
     except Exception as e:
-        print(f'Erro no callback: {e}')
+        app.logger.exception('Erro no callback: %s', e)
         flash('Ocorreu um erro durante a autorização do Spotify.', 'danger')
         return redirect(url_for('login_spotify'))
 
@@ -224,7 +790,7 @@ def select_playlist():
         flash('Por favor, autorize o Spotify primeiro.', 'warning')
         return redirect(url_for('login_spotify'))
     
-    return render_template('select_playlist.html')
+    return _render_static_page('select_playlist.html')
 
 @app.route('/jukebox')
 def jukebox():
@@ -243,7 +809,7 @@ def jukebox():
         flash('Por favor, selecione uma playlist primeiro.', 'warning')
         return redirect(url_for('select_playlist'))
     
-    return render_template('jukebox.html')
+    return _render_static_page('jukebox.html')
 
 @app.route('/api/user_playlists')
 def get_user_playlists():
@@ -251,41 +817,49 @@ def get_user_playlists():
     if not session.get('auth_id'):
         return {'error': 'Não autenticado.'}, 401
 
-    sp = get_spotipy_client()
-    if not sp:
+    access_token = get_access_token()
+    if not access_token:
         return {'error': 'Autorização do Spotify necessária.'}, 401
 
+    # ?refresh=1 ignora o cache e força uma nova busca no Spotify
+    cache_key = session['auth_id']
+    redis_key = f'user_playlists:{cache_key}'
+    if not request.args.get('refresh'):
+        cached = _cache_get(_USER_PLAYLISTS_CACHE, cache_key)
+        if cached is not None:
+            return _json_response(cached)
+        body = _redis_get(redis_key) if _REDIS else None
+        if body:
+            encoded = _encode_body(body)
+            _cache_set(_USER_PLAYLISTS_CACHE, cache_key, encoded)
+            return _json_response(encoded)
+
     try:
-        playlists = []
-        results = sp.current_user_playlists(limit=50)
-        playlists.extend(results['items'])
-        
-        while results['next']:
-            results = sp.next(results)
-            playlists.extend(results['items'])
-        
-        formatted_playlists = []
-        for playlist in playlists:
-            formatted_playlists.append({
-                'id': playlist['id'],
-                'name': playlist['name'],
-                'image': playlist['images'][0]['url'] if playlist['images'] else None,
-                'tracks_total': playlist['tracks']['total'],
-                'owner': playlist['owner']['display_name']
-            })
+        formatted_playlists = _fetch_all_pages(
+            lambda offset: _fetch_user_playlists_page(access_token, cache_key, offset),
+            limit=50
+        )
         
-        return {'playlists': formatted_playlists}, 200
+        encoded = _encode_json({'playlists': formatted_playlists})
+        _cache_set(_USER_PLAYLISTS_CACHE, cache_key, encoded)
+        if _REDIS:
+            _redis_setex(redis_key, USER_PLAYLISTS_REDIS_TTL, encoded[0])
+        return _json_response(encoded)
 
     except spotipy.SpotifyException as e:
-        if 'The access token expired' in str(e):
-            session.pop('token_info', None)
-            return {'error': 'Token de acesso expirado. Por favor, autorize novamente.'}, 401
-        print(f'Erro ao obter playlists: {e}')
-        return {'error': f'Erro ao carregar as playlists: {e}'}, 500
+        return _spotify_error_response(e, 'Erro ao carregar as playlists')
     except Exception as e:
-        print(f'Erro inesperado: {e}')
+        app.logger.exception('Erro inesperado: %s', e)
         return {'error': f'Ocorreu um erro inesperado: {e}'}, 500
 
+def _find_cached_playlist(auth_id, playlist_id):
+    """Procura uma playlist entre as playlists do usuário em cache, sem chamar o Spotify."""
+    encoded = _cache_get(_USER_PLAYLISTS_CACHE, auth_id)
+    if encoded is None:
+        return None
+    playlists = orjson.loads(encoded[0])['playlists']
+    return next((playlist for playlist in playlists if playlist['id'] == playlist_id), None)
+
 @app.route('/api/set_playlist', methods=['POST'])
 def set_playlist():
     """Endpoint API para definir a playlist selecionada e salvar no Supabase."""
@@ -307,73 +881,147 @@ def set_playlist():
         return {'error': 'Usuário não identificado.'}, 401
 
     try:
-        playlist = sp.playlist(playlist_id)
+        # Normalmente a playlist veio de /api/user_playlists e já está em cache
+        playlist = _find_cached_playlist(session['auth_id'], playlist_id)
+        if playlist:
+            playlist_name = playlist['name']
+            playlist_image_url = playlist['image']
+        else:
+            playlist = sp.playlist(playlist_id, fields='name,images(url)')
+            playlist_name = playlist['name']
+            playlist_image_url = _first_image_url(playlist['images'])
         
-        db_playlist = save_selected_playlist(
+        _submit_db_write(
+            save_selected_playlist,
             user_id=user_id,
             spotify_playlist_id=playlist_id,
-            playlist_name=playlist['name'],
-            playlist_image_url=playlist['images'][0]['url'] if playlist['images'] else None
+            playlist_name=playlist_name,
+            playlist_image_url=playlist_image_url
         )
         
-        if db_playlist:
-            session['selected_playlist_id'] = playlist_id
-            session['selected_playlist_name'] = playlist['name']
-            return {'message': f'Playlist "{playlist["name"]}" selecionada com sucesso!'}, 200
-        else:
-            return {'error': 'Erro ao salvar a playlist no banco de dados.'}, 500
-            
+        # As faixas da playlist anterior só eram usadas por este usuário na jukebox
+        previous_playlist_id = session.get('selected_playlist_id')
+        if previous_playlist_id and previous_playlist_id != playlist_id:
+            _cache_pop(_PLAYLIST_TRACKS_CACHE, (session['auth_id'], previous_playlist_id))
+
+        session['selected_playlist_id'] = playlist_id
+        session['selected_playlist_name'] = playlist_name
+        return {'message': f'Playlist "{playlist_name}" selecionada com sucesso!'}, 200
+
     except spotipy.SpotifyException as e:
-        print(f'Erro ao definir playlist: {e}')
-        return {'error': f'Erro ao selecionar playlist: {e}'}, 500
+        return _spotify_error_response(e, 'Erro ao selecionar playlist')
     except Exception as e:
-        print(f'Erro inesperado: {e}')
+        app.logger.exception('Erro inesperado: %s', e)
         return {'error': f'Ocorreu um erro inesperado: {e}'}, 500
 
+# Buscas em andamento, para agrupar requisições simultâneas idênticas
+_INFLIGHT = {}  # chave -> Future
+_INFLIGHT_LOCK = threading.Lock()
+
+def _coalesce(key, fetch):
+    """
+    Executa fetch uma única vez por chave entre requisições simultâneas.
+    Quem chega com a busca em andamento espera pelo mesmo resultado; se ela
+    falhar, cada uma tenta por conta própria (o erro pode ser do token de outro usuário).
+    """
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _INFLIGHT[key] = Future()
+
+    if not is_leader:
+        try:
+            return future.result()
+        except Exception:
+            return fetch()
+
+    try:
+        result = fetch()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            del _INFLIGHT[key]
+
+def _fetch_playlist_tracks(access_token, playlist_id, redis_key=None):
+    """
+    Busca todas as faixas de uma playlist e as serializa para a resposta.
+    Com redis_key, o resultado também é gravado no Redis.
+    """
+    formatted_tracks = _fetch_all_pages(
+        lambda offset: _spotify_get_json(
+            access_token,
+            f'playlists/{playlist_id}/tracks',
+            params={
+                'fields': PLAYLIST_ITEMS_FIELDS,
+                'limit': 100,
+                'offset': offset,
+                'additional_types': 'track'
+            }
+        ),
+        limit=100,
+        format_items=_format_tracks
+    )
+    encoded = _encode_json({'tracks': formatted_tracks})
+    if redis_key:
+        _redis_setex(redis_key, PLAYLIST_TRACKS_REDIS_TTL, encoded[0])
+    return encoded
+
 @app.route('/api/playlist_tracks')
 def get_playlist_tracks():
     """Endpoint API para obter as músicas da playlist selecionada."""
     if not session.get('auth_id'):
         return {'error': 'Não autenticado.'}, 401
 
-    sp = get_spotipy_client()
-    if not sp:
+    access_token = get_access_token()
+    if not access_token:
         return {'error': 'Autorização do Spotify necessária.'}, 401
 
     playlist_id = session.get('selected_playlist_id')
     if not playlist_id:
         return {'error': 'Nenhuma playlist selecionada.'}, 400
 
+    # ?refresh=1 ignora o cache e força uma nova busca no Spotify
+    cache_key = (session['auth_id'], playlist_id)
+    if not request.args.get('refresh'):
+        cached = _cache_get(_PLAYLIST_TRACKS_CACHE, cache_key)
+        if cached is not None:
+            return _json_response(cached)
+
     try:
-        tracks = []
-        results = sp.playlist_items(playlist_id)
-        tracks.extend(results['items'])
-        while results['next']:
-            results = sp.next(results)
-            tracks.extend(results['items'])
-        
-        formatted_tracks = []
-        for item in tracks:
-            track = item['track']
-            if track:
-                formatted_tracks.append({
-                    'id': track['id'],
-                    'name': track['name'],
-                    'artist': ', '.join([artist['name'] for artist in track['artists']]),
-                    'uri': track['uri'],
-                    'album_art': track['album']['images'][0]['url'] if track['album']['images'] else None
-                })
-        
-        return {'tracks': formatted_tracks}, 200
+        redis_key = None
+        body = None
+        if _REDIS:
+            # O snapshot_id muda sempre que a playlist é alterada,
+            # então a chave do Redis nunca fica desatualizada
+            snapshot_id = _spotify_get_json(
+                access_token, f'playlists/{playlist_id}', params={'fields': 'snapshot_id'}
+            )['snapshot_id']
+            redis_key = f'playlist_tracks:{playlist_id}:{snapshot_id}'
+            body = _redis_get(redis_key)
+
+        if body:
+            encoded = _encode_body(body)
+        else:
+            # Requisições simultâneas para a mesma playlist compartilham uma única busca.
+            # Sem Redis, o acesso à playlist não foi conferido com o token de cada
+            # usuário (snapshot_id), então a busca só é compartilhada pelo mesmo usuário.
+            encoded = _coalesce(
+                redis_key or f"playlist_tracks:{session['auth_id']}:{playlist_id}",
+                lambda: _fetch_playlist_tracks(access_token, playlist_id, redis_key)
+            )
+
+        _cache_set(_PLAYLIST_TRACKS_CACHE, cache_key, encoded)
+        return _json_response(encoded)
 
     except spotipy.SpotifyException as e:
-        if 'The access token expired' in str(e):
-            session.pop('token_info', None)
-            return {'error': 'Token de acesso expirado. Por favor, autorize novamente.'}, 401
-        print(f'Erro ao obter playlist: {e}')
-        return {'error': f'Erro ao carregar a playlist: {e}'}, 500
+        return _spotify_error_response(e, 'Erro ao carregar a playlist')
     except Exception as e:
-        print(f'Erro inesperado: {e}')
+        app.logger.exception('Erro inesperado: %s', e)
         return {'error': f'Ocorreu um erro inesperado: {e}'}, 500
 
 @app.route('/api/add_to_queue', methods=['POST'])
@@ -401,52 +1049,55 @@ def add_to_queue():
         sp.add_to_queue(track_uri)
         
         if user_id and track_id:
-            save_to_queue_history(
-                user_id=user_id,
-                spotify_track_id=track_id,
-                track_name=track_name or 'Unknown',
-                track_artist=track_artist or 'Unknown',
-                playlist_id=None
-            )
+            _enqueue_queue_history(user_id, {
+                'id': track_id,
+                'name': track_name or 'Unknown',
+                'artist': track_artist or 'Unknown'
+            })
         
         return {'message': 'Música adicionada à fila com sucesso!'}, 200
     except spotipy.SpotifyException as e:
-        if 'No active device found' in str(e):
-            return {'error': 'Nenhum dispositivo ativo encontrado. Por favor, inicie a reprodução no Spotify.'}, 409
-        elif 'The access token expired' in str(e):
-            session.pop('token_info', None)
-            return {'error': 'Token de acesso expirado. Por favor, autorize novamente.'}, 401
-        print(f'Erro ao adicionar à fila: {e}')
-        return {'error': f'Erro ao adicionar à fila: {e}'}, 500
+        return _spotify_error_response(e, 'Erro ao adicionar à fila')
     except Exception as e:
-        print(f'Erro inesperado: {e}')
+        app.logger.exception('Erro inesperado: %s', e)
         return {'error': f'Ocorreu um erro inesperado: {e}'}, 500
 
 @app.route('/logout')
 def logout():
     """Remove o token de sessão e desloga o usuário."""
     try:
-        session.pop('auth_id', None)
-        session.pop('email', None)
-        session.pop('user_id', None)
-        session.pop('user_name', None)
-        session.pop('token_info', None)
-        session.pop('selected_playlist_id', None)
-        session.pop('selected_playlist_name', None)
-        session.modified = True
+        if session.get('auth_id'):
+            invalidate_user(session['auth_id'])
+        _clear_spotify_token()
+        session.clear()
         
         flash('Você foi desconectado.', 'info')
         return redirect(url_for('index'))
     except Exception as e:
-        print(f'Erro ao fazer logout: {e}')
+        app.logger.exception('Erro ao fazer logout: %s', e)
         flash('Ocorreu um erro ao desconectar. Tente novamente.', 'danger')
         return redirect(url_for('index'))
 
+@app.route('/healthz')
+def healthz():
+    """Health check para o load balancer, sem tocar na sessão."""
+    return 'ok', 200
+
+@app.route('/healthz/db')
+def healthz_db():
+    """Health check que também verifica a conexão com o Supabase."""
+    if ping_database():
+        return 'ok', 200
+    return 'database unavailable', 503
+
 @app.before_request
 def log_session():
-    """Log da sessão para debug."""
-    print(f"📍 Rota: {request.path}")
-    print(f"📦 Session data: auth_id={session.get('auth_id')}, user_id={session.get('user_id')}")
+    """Log da sessão para debug (apenas com app.debug)."""
+    if not app.debug or request.path.startswith(('/healthz', '/static/', '/favicon')):
+        return
+    app.logger.debug('📍 Rota: %s', request.path)
+    app.logger.debug('📦 Session data: auth_id=%s, user_id=%s', session.get('auth_id'), session.get('user_id'))
 
 if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção use: gunicorn -c gunicorn.conf.py app:app
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -1,16 +1,148 @@
 import os
-from supabase import create_client, Client
+import atexit
+import logging
+import functools
+from dataclasses import dataclass, fields
+from threading import Lock
+import httpx
+from cachetools import TTLCache
+from postgrest import ReturnMethod
+from postgrest.exceptions import APIError
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Configurar cliente Supabase com SERVICE_ROLE_KEY (para operações no servidor)
+log = logging.getLogger(__name__)
+
+# Cliente Supabase com SERVICE_ROLE_KEY (para operações no servidor)
+# e cliente com a chave pública (para verificar tokens de usuários)
 SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
 SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-supabase_client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Um único pool HTTP/2 compartilhado pelos dois clientes (auth e postgrest),
+# em vez de um pool por subcliente. Com http_client próprio, o Supabase
+# ignora os timeouts do ClientOptions, por isso o timeout fica no httpx.
+# O tamanho do pool é configurável para acompanhar o número de workers/threads.
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '50'))  # conexões mantidas abertas
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '100'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))  # espera por uma conexão livre
+DB_POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', '30'))  # segundos ociosa antes de fechar
+SUPABASE_HTTP_LIMITS = httpx.Limits(
+    max_connections=DB_POOL_MAX,
+    max_keepalive_connections=DB_POOL_MIN,
+    keepalive_expiry=DB_POOL_RECYCLE
+)
+
+@functools.lru_cache(maxsize=1)
+def _http_client() -> httpx.Client:
+    """Pool HTTP compartilhado, criado no primeiro uso."""
+    return httpx.Client(
+        http2=True,
+        follow_redirects=True,
+        timeout=httpx.Timeout(10.0, connect=2.0, pool=DB_POOL_TIMEOUT),
+        limits=SUPABASE_HTTP_LIMITS
+    )
+
+@functools.lru_cache(maxsize=1)
+def _clients() -> tuple[Client, Client]:
+    """
+    Retorna (cliente service role, cliente público), criados no primeiro uso.
+    Falha com uma mensagem clara se faltar alguma variável de ambiente.
+    """
+    missing = [
+        name for name, value in (
+            ('SUPABASE_URL', SUPABASE_URL),
+            ('SUPABASE_SERVICE_ROLE_KEY', SUPABASE_SERVICE_ROLE_KEY),
+            ('SUPABASE_KEY', SUPABASE_KEY),
+        )
+        if not value
+    ]
+    if missing:
+        raise RuntimeError(f"Variáveis de ambiente do Supabase não definidas: {', '.join(missing)}")
+
+    return (
+        create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options=ClientOptions(httpx_client=_http_client())),
+        create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=_http_client()))
+    )
+
+def close_clients():
+    """Fecha as conexões do pool HTTP compartilhado pelos clientes Supabase."""
+    if _http_client.cache_info().currsize:
+        _http_client().close()
+    _http_client.cache_clear()
+    _clients.cache_clear()
+
+atexit.register(close_clients)
+
+# --- Modelos ---
+# Registros retornados pelas funções deste módulo. Com __slots__ ocupam bem
+# menos memória que um dict por linha e o acesso aos campos é por atributo.
+
+@dataclass(slots=True)
+class User:
+    id: str | None  # uuid
+    auth_id: str
+    email: str | None = None
+    display_name: str | None = None
+    spotify_id: str | None = None
+    profile_image_url: str | None = None
+
+@dataclass(slots=True)
+class Playlist:
+    spotify_playlist_id: str
+    playlist_name: str
+    playlist_image_url: str | None = None
+    selected_at: str | None = None
+
+@dataclass(slots=True)
+class QueueTrack:
+    spotify_track_id: str
+    track_name: str
+    track_artist: str
+    added_at: str | None = None
+    id: str | None = None  # desempata o cursor de get_user_queue_history
+
+def _from_row(model, row: dict):
+    """Cria o modelo a partir de uma linha do Supabase, ignorando colunas extras."""
+    return model(**{field.name: row.get(field.name) for field in fields(model)})
+
+def _columns(model) -> str:
+    """Projeção para select(): exatamente os campos do modelo, em vez de '*'."""
+    return ','.join(field.name for field in fields(model))
+
+# Colunas retornadas em cada tabela: os modelos acima são a única fonte
+USER_COLUMNS = _columns(User)
+PLAYLIST_COLUMNS = _columns(Playlist)
+QUEUE_HISTORY_COLUMNS = _columns(QueueTrack)
+
+# Cache em memória de usuários por auth_id e por spotify_id, evitando uma
+# ida ao Supabase a cada busca do mesmo usuário
+_user_cache = TTLCache(maxsize=10_000, ttl=300)
+_user_by_spotify_cache = TTLCache(maxsize=10_000, ttl=300)
+# Índice reverso auth_id -> spotify_id, para invalidar _user_by_spotify_cache
+# sem percorrer o cache inteiro
+_spotify_id_by_auth_id = TTLCache(maxsize=10_000, ttl=300)
+# Tokens já verificados no Supabase Auth; TTL curto para não manter
+# por muito tempo um token revogado
+_verified_token_cache = TTLCache(maxsize=10_000, ttl=60)
+_user_cache_lock = Lock()
+
+def ping() -> bool:
+    """Verifica se o Supabase responde, com a consulta mais leve possível."""
+    try:
+        # Dentro do try: sem configuração do Supabase também é indisponível
+        svc, _ = _clients()
+        svc.table('users').select('id').limit(1).execute()
+        return True
+    except Exception as e:
+        log.warning('❌ Supabase indisponível: %s', e)
+        return False
+
+def _returning(return_row: bool) -> ReturnMethod:
+    """Prefer: return=representation só quando quem chama usa a linha gravada."""
+    return ReturnMethod.representation if return_row else ReturnMethod.minimal
 
 # --- Funções de Autenticação ---
 
@@ -19,12 +151,13 @@ def register_user(email: str, password: str):
     Registra um novo usuário no Supabase Auth.
     Retorna o usuário autenticado ou None se houver erro.
     """
+    svc, _ = _clients()
     try:
-        response = supabase.auth.sign_up({"email": email, "password": password})
-        print(f"✅ Usuário registrado: {email}")
+        response = svc.auth.sign_up({"email": email, "password": password})
+        log.debug('✅ Usuário registrado: %s', email)
         return response.user
     except Exception as e:
-        print(f"❌ Erro ao registrar usuário: {e}")
+        log.warning('❌ Erro ao registrar usuário: %s', e)
         return None
 
 def login_user(email: str, password: str):
@@ -32,23 +165,34 @@ def login_user(email: str, password: str):
     Faz login de um usuário com email e senha.
     Retorna a sessão do usuário ou None se houver erro.
     """
+    svc, _ = _clients()
     try:
-        response = supabase.auth.sign_in_with_password({"email": email, "password": password})
-        print(f"✅ Usuário logado: {email}")
+        response = svc.auth.sign_in_with_password({"email": email, "password": password})
+        log.debug('✅ Usuário logado: %s', email)
         return response
     except Exception as e:
-        print(f"❌ Erro ao fazer login: {e}")
+        log.warning('❌ Erro ao fazer login: %s', e)
         return None
 
 def verify_token(access_token: str):
     """
     Verifica se um token de acesso é válido e retorna o usuário.
     """
+    with _user_cache_lock:
+        user = _verified_token_cache.get(access_token)
+    if user is not None:
+        return user
+
+    _, anon = _clients()
     try:
-        response = supabase_client.auth.get_user(access_token)
-        return response.user
+        response = anon.auth.get_user(access_token)
+        user = response.user
+        if user:
+            with _user_cache_lock:
+                _verified_token_cache[access_token] = user
+        return user
     except Exception as e:
-        print(f"❌ Token inválido: {e}")
+        log.warning('❌ Token inválido: %s', e)
         return None
 
 # --- Funções de Usuário ---
@@ -57,49 +201,37 @@ def get_or_create_user(auth_id: str, email: str, display_name: str, spotify_id:
     """
     Obtém ou cria um usuário no Supabase baseado no auth_id (UUID do Supabase Auth).
     Atualiza com dados do Spotify se fornecidos.
+    Usa um único upsert (requer índice único em users.auth_id).
     """
+    svc, _ = _clients()
     try:
-        # Tenta buscar o usuário existente
-        response = supabase.table('users').select('*').eq('auth_id', auth_id).execute()
-        
-        if response.data:
-            user = response.data[0]
-            print(f"✅ Usuário encontrado: {user['display_name']}")
-            return user
-        else:
-            # Usuário não existe, cria um novo
-            new_user = {
-                'auth_id': auth_id,
-                'email': email,
-                'display_name': display_name,
-                'spotify_id': spotify_id,
-                'profile_image_url': profile_image_url
-            }
-            response = supabase.table('users').insert(new_user).execute()
-            print(f"✅ Novo usuário criado: {display_name}")
-            return response.data[0]
+        user_data = {
+            'auth_id': auth_id,
+            'email': email,
+            'display_name': display_name,
+            'spotify_id': spotify_id,
+            'profile_image_url': profile_image_url
+        }
+        # Campos None ficam de fora, para o ON CONFLICT DO UPDATE não apagar valores existentes
+        user_data = {key: value for key, value in user_data.items() if value is not None}
+
+        response = svc.table('users').upsert(user_data, on_conflict='auth_id').execute()
+        user = _from_row(User, response.data[0])
+        invalidate_user(auth_id)
+        log.debug('✅ Usuário salvo: %s', user.display_name)
+        return user
     except Exception as e:
-        print(f'❌ Erro ao obter ou criar usuário: {e}')
+        log.exception('❌ Erro ao obter ou criar usuário: %s', e)
         return None
 
 def update_user_with_spotify(auth_id: str, spotify_id: str, display_name: str, email: str = None, profile_image_url: str = None):
     """
     Atualiza um usuário existente com dados do Spotify.
     Retorna um dicionário com sucesso/erro.
+    A unicidade do spotify_id é garantida pelo índice único em users.spotify_id.
     """
+    svc, _ = _clients()
     try:
-        # Verificar se este spotify_id já está vinculado a outro usuário
-        existing_user = user_with_spotify_id_exists(spotify_id, exclude_auth_id=auth_id)
-        
-        if existing_user:
-            # spotify_id já existe para outro usuário
-            print(f"❌ Spotify ID já vinculado ao usuário: {existing_user['email']}")
-            return {
-                'success': False,
-                'error': 'Esta conta Spotify já está vinculada a outro usuário',
-                'existing_user_email': existing_user['email']
-            }
-        
         update_data = {
             'spotify_id': spotify_id,
             'display_name': display_name,
@@ -109,14 +241,38 @@ def update_user_with_spotify(auth_id: str, spotify_id: str, display_name: str, e
         if profile_image_url:
             update_data['profile_image_url'] = profile_image_url
         
-        response = supabase.table('users').update(update_data).eq('auth_id', auth_id).execute()
-        print(f"✅ Usuário atualizado com dados do Spotify: {display_name}")
+        try:
+            response = svc.table('users').update(update_data).eq('auth_id', auth_id).execute()
+        except APIError as e:
+            if e.code != '23505':
+                raise
+            # spotify_id já existe para outro usuário (violação de unicidade)
+            result = {
+                'success': False,
+                'error': 'Esta conta Spotify já está vinculada a outro usuário'
+            }
+            existing_user = get_user_by_spotify_id(spotify_id)
+            if existing_user:
+                log.warning('❌ Spotify ID já vinculado ao usuário: %s', existing_user.email)
+                result['existing_user_email'] = existing_user.email
+            return result
+        if not response.data:
+            # Nenhuma linha com esse auth_id: o update não cria usuários
+            log.warning('❌ Usuário não encontrado para atualizar: %s', auth_id)
+            return {
+                'success': False,
+                'error': 'Usuário não encontrado. Faça login novamente.'
+            }
+        invalidate_user(auth_id)
+        with _user_cache_lock:
+            _user_by_spotify_cache.pop(spotify_id, None)
+        log.debug('✅ Usuário atualizado com dados do Spotify: %s', display_name)
         return {
             'success': True,
-            'user': response.data[0] if response.data else None
+            'user': _from_row(User, response.data[0])
         }
     except Exception as e:
-        print(f'❌ Erro ao atualizar usuário: {e}')
+        log.exception('❌ Erro ao atualizar usuário: %s', e)
         return {
             'success': False,
             'error': str(e)
@@ -126,30 +282,65 @@ def get_user_by_auth_id(auth_id: str):
     """
     Obtém um usuário pelo auth_id.
     """
+    with _user_cache_lock:
+        user = _user_cache.get(auth_id)
+    if user is not None:
+        return user
+
+    svc, _ = _clients()
     try:
-        response = supabase.table('users').select('*').eq('auth_id', auth_id).execute()
-        return response.data[0] if response.data else None
+        response = svc.table('users').select(USER_COLUMNS).eq('auth_id', auth_id).execute()
+        user = _from_row(User, response.data[0]) if response.data else None
+        if user:
+            with _user_cache_lock:
+                _user_cache[auth_id] = user
+        return user
     except Exception as e:
-        print(f'❌ Erro ao obter usuário: {e}')
+        log.exception('❌ Erro ao obter usuário: %s', e)
         return None
 
+def invalidate_user(auth_id: str):
+    """
+    Remove o usuário dos caches locais de get_user_by_auth_id
+    e get_user_by_spotify_id.
+    """
+    with _user_cache_lock:
+        user = _user_cache.pop(auth_id, None)
+        spotify_ids = {_spotify_id_by_auth_id.pop(auth_id, None), user.spotify_id if user else None}
+        for spotify_id in spotify_ids - {None}:
+            _user_by_spotify_cache.pop(spotify_id, None)
+
 def get_user_by_spotify_id(spotify_id: str):
     """
     Obtém um usuário pelo spotify_id.
     """
+    with _user_cache_lock:
+        user = _user_by_spotify_cache.get(spotify_id)
+    if user is not None:
+        return user
+
+    svc, _ = _clients()
     try:
-        response = supabase.table('users').select('*').eq('spotify_id', spotify_id).execute()
-        return response.data[0] if response.data else None
+        response = svc.table('users').select(USER_COLUMNS).eq('spotify_id', spotify_id).execute()
+        user = _from_row(User, response.data[0]) if response.data else None
+        if user:
+            with _user_cache_lock:
+                _user_by_spotify_cache[spotify_id] = user
+                _spotify_id_by_auth_id[user.auth_id] = spotify_id
+        return user
     except Exception as e:
-        print(f'❌ Erro ao obter usuário por spotify_id: {e}')
+        log.exception('❌ Erro ao obter usuário por spotify_id: %s', e)
         return None
 
 # --- Funções de Playlists ---
 
-def save_selected_playlist(user_id: str, spotify_playlist_id: str, playlist_name: str, playlist_image_url: str = None):
+def save_selected_playlist(user_id: str, spotify_playlist_id: str, playlist_name: str, playlist_image_url: str = None, return_row: bool = False):
     """
     Salva a playlist selecionada pelo usuário.
+    Com return_row, retorna a linha salva; sem ele, o PostgREST não a devolve
+    (return=minimal) e o retorno é True. Retorna None se houver erro.
     """
+    svc, _ = _clients()
     try:
         playlist_data = {
             'user_id': user_id,
@@ -157,79 +348,152 @@ def save_selected_playlist(user_id: str, spotify_playlist_id: str, playlist_name
             'playlist_name': playlist_name,
             'playlist_image_url': playlist_image_url
         }
-        response = supabase.table('playlists').upsert(playlist_data).execute()
-        print(f"✅ Playlist salva: {playlist_name}")
-        return response.data[0] if response.data else None
+        response = svc.table('playlists').upsert(playlist_data, returning=_returning(return_row)).execute()
+        log.debug('✅ Playlist salva: %s', playlist_name)
+        if not return_row:
+            return True
+        return _from_row(Playlist, response.data[0]) if response.data else None
     except Exception as e:
-        print(f'❌ Erro ao salvar playlist: {e}')
+        log.exception('❌ Erro ao salvar playlist: %s', e)
         return None
 
 def get_user_playlists(user_id: str):
     """
     Obtém todas as playlists salvas do usuário.
+    Obsoleta: use get_user_playlists_with_last.
     """
+    svc, _ = _clients()
     try:
-        response = supabase.table('playlists').select('*').eq('user_id', user_id).execute()
-        return response.data
+        response = svc.table('playlists').select(PLAYLIST_COLUMNS).eq('user_id', user_id).execute()
+        return [_from_row(Playlist, row) for row in response.data]
     except Exception as e:
-        print(f'❌ Erro ao obter playlists do usuário: {e}')
+        log.exception('❌ Erro ao obter playlists do usuário: %s', e)
         return []
 
+def get_user_playlists_with_last(user_id: str) -> tuple[list[Playlist], Playlist | None]:
+    """
+    Obtém as playlists salvas do usuário e a última selecionada com uma
+    única consulta, em vez de get_user_playlists + get_last_selected_playlist.
+    """
+    svc, _ = _clients()
+    try:
+        response = svc.table('playlists').select(PLAYLIST_COLUMNS).eq('user_id', user_id).order('selected_at', desc=True).execute()
+        playlists = [_from_row(Playlist, row) for row in response.data]
+        return playlists, playlists[0] if playlists else None
+    except Exception as e:
+        log.exception('❌ Erro ao obter playlists do usuário: %s', e)
+        return [], None
+
 def get_last_selected_playlist(user_id: str):
     """
     Obtém a última playlist selecionada pelo usuário.
+    Obsoleta: use get_user_playlists_with_last.
     """
+    svc, _ = _clients()
     try:
-        response = supabase.table('playlists').select('*').eq('user_id', user_id).order('selected_at', desc=True).limit(1).execute()
-        return response.data[0] if response.data else None
+        response = svc.table('playlists').select(PLAYLIST_COLUMNS).eq('user_id', user_id).order('selected_at', desc=True).limit(1).execute()
+        return _from_row(Playlist, response.data[0]) if response.data else None
     except Exception as e:
-        print(f'❌ Erro ao obter última playlist: {e}')
+        log.exception('❌ Erro ao obter última playlist: %s', e)
         return None
 
 # --- Funções de Histórico de Fila ---
 
-def save_to_queue_history(user_id: str, spotify_track_id: str, track_name: str, track_artist: str, playlist_id: str = None):
+# Linhas por INSERT em lote, dentro do limite de payload do PostgREST
+QUEUE_HISTORY_BATCH_SIZE = 500
+
+def save_to_queue_history(user_id: str, spotify_track_id: str, track_name: str, track_artist: str, playlist_id: str = None, return_row: bool = False):
     """
     Salva uma música adicionada à fila no histórico.
+    Com return_row, retorna a linha inserida; sem ele, retorna True.
+    Retorna None se houver erro.
+    """
+    rows = save_tracks_to_queue_history(
+        user_id,
+        [{'id': spotify_track_id, 'name': track_name, 'artist': track_artist}],
+        playlist_id,
+        return_row=return_row
+    )
+    if rows is None:
+        return None
+    if not return_row:
+        return True
+    return rows[0] if rows else None
+
+def save_tracks_to_queue_history(user_id: str, tracks: list, playlist_id: str = None, return_row: bool = False):
+    """
+    Salva várias músicas no histórico com um único INSERT por lote.
+    Cada faixa é um dict com 'id', 'name' e 'artist'.
+    Retorna as linhas inseridas (lista vazia sem return_row) ou None se houver erro.
     """
+    return save_queue_history_rows(
+        [queue_history_row(user_id, track, playlist_id) for track in tracks],
+        return_row=return_row
+    )
+
+def queue_history_row(user_id: str, track: dict, playlist_id: str = None) -> dict:
+    """Linha de queue_history para uma faixa ('id', 'name' e 'artist')."""
+    return {
+        'user_id': user_id,
+        'spotify_track_id': track['id'],
+        'track_name': track['name'],
+        'track_artist': track['artist'],
+        'playlist_id': playlist_id
+    }
+
+def save_queue_history_rows(rows: list, return_row: bool = False):
+    """
+    Salva linhas de queue_history (de um ou vários usuários) com um único
+    INSERT por lote. Monte cada linha com queue_history_row.
+    Retorna as linhas inseridas (lista vazia sem return_row) ou None se houver erro.
+    """
+    svc, _ = _clients()
     try:
-        history_data = {
-            'user_id': user_id,
-            'spotify_track_id': spotify_track_id,
-            'track_name': track_name,
-            'track_artist': track_artist,
-            'playlist_id': playlist_id
-        }
-        response = supabase.table('queue_history').insert(history_data).execute()
-        print(f"✅ Música adicionada ao histórico: {track_name}")
-        return response.data[0] if response.data else None
+        inserted = []
+        for start in range(0, len(rows), QUEUE_HISTORY_BATCH_SIZE):
+            response = svc.table('queue_history').insert(
+                rows[start:start + QUEUE_HISTORY_BATCH_SIZE], returning=_returning(return_row)
+            ).execute()
+            inserted.extend(_from_row(QueueTrack, row) for row in response.data)
+        log.debug('✅ %d música(s) adicionada(s) ao histórico', len(rows))
+        return inserted
     except Exception as e:
-        print(f'❌ Erro ao salvar no histórico de fila: {e}')
+        log.exception('❌ Erro ao salvar no histórico de fila: %s', e)
         return None
 
-def get_user_queue_history(user_id: str, limit: int = 50):
+def get_user_queue_history(user_id: str, limit: int = 50, before: str | None = None, before_id: str | None = None):
     """
     Obtém o histórico de músicas adicionadas à fila do usuário.
+    Paginação por cursor: para a próxima página, passe em before e before_id
+    o added_at e o id da última música retornada. O id desempata as músicas
+    gravadas no mesmo INSERT em lote, que têm o mesmo added_at.
     """
+    svc, _ = _clients()
     try:
-        response = supabase.table('queue_history').select('*').eq('user_id', user_id).order('added_at', desc=True).limit(limit).execute()
-        return response.data
+        query = svc.table('queue_history').select(QUEUE_HISTORY_COLUMNS).eq('user_id', user_id)
+        if before and before_id:
+            query = query.or_(
+                f'added_at.lt."{before}",and(added_at.eq."{before}",id.lt."{before_id}")'
+            )
+        elif before:
+            query = query.lt('added_at', before)
+        response = query.order('added_at', desc=True).order('id', desc=True).limit(limit).execute()
+        return [_from_row(QueueTrack, row) for row in response.data]
     except Exception as e:
-        print(f'❌ Erro ao obter histórico de fila: {e}')
+        log.exception('❌ Erro ao obter histórico de fila: %s', e)
         return []
 
 def get_recent_tracks(user_id: str, days: int = 7):
     """
     Obtém as músicas adicionadas nos últimos N dias.
     """
+    svc, _ = _clients()
     try:
-        from datetime import datetime, timedelta
-        start_date = (datetime.now() - timedelta(days=days)).isoformat()
-        
-        response = supabase.table('queue_history').select('*').eq('user_id', user_id).gte('added_at', start_date).order('added_at', desc=True).execute()
-        return response.data
+        # O intervalo é calculado no banco (função recent_queue)
+        response = svc.rpc('recent_queue', {'uid': user_id, 'days': days}).select(QUEUE_HISTORY_COLUMNS).execute()
+        return [_from_row(QueueTrack, row) for row in response.data]
     except Exception as e:
-        print(f'❌ Erro ao obter tracks recentes: {e}')
+        log.exception('❌ Erro ao obter tracks recentes: %s', e)
         return []
     
 def user_with_spotify_id_exists(spotify_id: str, exclude_auth_id: str = None):
@@ -237,14 +501,13 @@ def user_with_spotify_id_exists(spotify_id: str, exclude_auth_id: str = None):
     Verifica se um spotify_id já está vinculado a outro usuário.
     Se exclude_auth_id for fornecido, ignora esse usuário na busca.
     """
+    svc, _ = _clients()
     try:
-        response = supabase.table('users').select('*').eq('spotify_id', spotify_id).execute()
-        
-        if response.data:
-            for user in response.data:
-                if exclude_auth_id is None or user['auth_id'] != exclude_auth_id:
-                    return user
-        return None
+        query = svc.table('users').select('auth_id,email').eq('spotify_id', spotify_id)
+        if exclude_auth_id is not None:
+            query = query.neq('auth_id', exclude_auth_id)
+        response = query.limit(1).execute()
+        return _from_row(User, response.data[0]) if response.data else None
     except Exception as e:
-        print(f'❌ Erro ao verificar spotify_id: {e}')
+        log.exception('❌ Erro ao verificar spotify_id: %s', e)
         return None
\ No newline at end of file
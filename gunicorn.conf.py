@@ -0,0 +1,13 @@
+# Configuração do Gunicorn para produção:
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Os handlers passam quase todo o tempo esperando respostas HTTPS do Spotify
+# e do Supabase, então cada worker usa várias threads (gthread): o GIL é
+# liberado durante a espera em socket e as requisições andam em paralelo.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+timeout = 60
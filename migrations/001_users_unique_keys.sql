@@ -0,0 +1,5 @@
+-- Chaves únicas usadas pelos upserts de database.py:
+-- get_or_create_user / update_user_with_spotify fazem upsert com on_conflict='auth_id',
+-- e um spotify_id repetido gera o erro 23505 (conta Spotify já vinculada).
+CREATE UNIQUE INDEX IF NOT EXISTS users_auth_id_key ON users (auth_id);
+CREATE UNIQUE INDEX IF NOT EXISTS users_spotify_id_key ON users (spotify_id);
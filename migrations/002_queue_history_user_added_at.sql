@@ -0,0 +1,3 @@
+-- get_user_queue_history e get_recent_tracks filtram por user_id e ordenam
+-- por added_at DESC: o índice composto evita o sort sobre todas as linhas do usuário.
+CREATE INDEX IF NOT EXISTS queue_history_user_added_idx ON queue_history (user_id, added_at DESC);
@@ -0,0 +1,12 @@
+-- Músicas adicionadas à fila nos últimos d dias, usada por get_recent_tracks.
+-- O limite é calculado com o relógio do banco (now()), não o do servidor da aplicação.
+CREATE OR REPLACE FUNCTION recent_queue(uid uuid, d int)
+RETURNS SETOF queue_history
+LANGUAGE sql
+AS $$
+    SELECT *
+    FROM queue_history
+    WHERE user_id = uid
+      AND added_at >= now() - (d || ' days')::interval
+    ORDER BY added_at DESC
+$$;
@@ -0,0 +1,4 @@
+-- O índice único de spotify_id só precisa cobrir usuários com Spotify vinculado:
+-- o índice parcial é menor e continua gerando o erro 23505 em update_user_with_spotify.
+CREATE UNIQUE INDEX IF NOT EXISTS users_spotify_id_uq ON users (spotify_id) WHERE spotify_id IS NOT NULL;
+DROP INDEX IF EXISTS users_spotify_id_key;
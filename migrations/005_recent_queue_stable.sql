@@ -0,0 +1,16 @@
+-- recent_queue passa a ser STABLE (só lê dados; o planner pode otimizar e o
+-- PostgREST a aceita via GET) e usa make_interval em vez de montar o intervalo
+-- a partir de texto. O nome do parâmetro muda, então a função é recriada.
+DROP FUNCTION IF EXISTS recent_queue(uuid, int);
+
+CREATE FUNCTION recent_queue(uid uuid, days int)
+RETURNS SETOF queue_history
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT *
+    FROM queue_history
+    WHERE user_id = uid
+      AND added_at >= now() - make_interval(days => days)
+    ORDER BY added_at DESC
+$$;
@@ -0,0 +1,5 @@
+-- get_user_queue_history pagina por (added_at, id): as músicas de um mesmo
+-- INSERT em lote têm o mesmo added_at, e o id desempata. O índice passa a
+-- cobrir a ordenação completa.
+CREATE INDEX IF NOT EXISTS queue_history_user_added_id_idx ON queue_history (user_id, added_at DESC, id DESC);
+DROP INDEX IF EXISTS queue_history_user_added_idx;